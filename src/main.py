@@ -1,19 +1,20 @@
 import os
 import sys
 import base64
+import hashlib
+import random
+import re
 import time
-from openai import AzureOpenAI
+from concurrent.futures import ThreadPoolExecutor
 import argparse
 from pathlib import Path
 import json
 import logging
 
-# Load environment variables from .env file
-from src.config import load_env_file
 from src.preprocessor import LogPreprocessor
 
-# Make sure environment variables are loaded
-load_env_file()
+# The openai package (and the .env loader) are imported lazily so that
+# --help and preprocessing-only code paths don't pay its import cost
 
 # Configure logging
 logging.basicConfig(
@@ -26,14 +27,54 @@ logging.basicConfig(
 
 logger = logging.getLogger("devops_error_analyzer")
 
+# Default prompt token budget: leaves room for the response and prompt
+# scaffolding within a 128k model context
+DEFAULT_TOKEN_BUDGET = 100000
+
+def _format_stats(error_stats):
+    """
+    Format error pattern statistics as a summary block to prepend to
+    the analysis prompt
+    """
+    stats_summary = "\n\n" + "="*80 + "\nERROR STATISTICS SUMMARY\n" + "="*80 + "\n"
+    stats_summary += f"Total errors identified: {error_stats['error_count']}\n"
+    stats_summary += f"Total warnings identified: {error_stats['warning_count']}\n"
+
+    if error_stats['exception_types']:
+        stats_summary += "\nException types:\n"
+        for exception, count in error_stats['exception_types'].items():
+            stats_summary += f"- {exception}: {count} occurrences\n"
+
+    if error_stats['error_codes']:
+        stats_summary += "\nError codes:\n"
+        for code, count in error_stats['error_codes'].items():
+            stats_summary += f"- {code}: {count} occurrences\n"
+
+    return stats_summary
+
 class DevOpsErrorAnalyzer:
-    def __init__(self, endpoint=None, deployment=None, api_key=None):
+    def __init__(self, endpoint=None, deployment=None, api_key=None, use_cache=True):
         """
         Initialize the DevOps Error Analyzer with Azure OpenAI configuration
+
+        Args:
+            endpoint: Azure OpenAI endpoint URL
+            deployment: Azure OpenAI deployment name
+            api_key: Azure OpenAI API key
+            use_cache: Whether to reuse cached analyses for identical prompts
         """
+        # Deferred imports: pulling in the OpenAI SDK costs a few hundred ms
+        # (pydantic/httpx), so it only happens when an analyzer is created
+        from src.config import load_env_file
+        from openai import AzureOpenAI
+
+        load_env_file()
+
         self.endpoint = endpoint or os.getenv("ENDPOINT_URL")
         self.deployment = deployment or os.getenv("DEPLOYMENT_NAME")
         self.api_key = api_key or os.getenv("AZURE_OPENAI_API_KEY")
+        self.use_cache = use_cache
+        self._cache_dir = Path.home() / ".cache" / "devops_error_analyzer"
         
         if not self.api_key:
             raise ValueError("No API key provided. Set the AZURE_OPENAI_API_KEY environment variable or pass it as a parameter.")
@@ -91,31 +132,213 @@ class DevOpsErrorAnalyzer:
             }
         ]
 
+        # Check the on-disk cache before spending an API round-trip
+        cache_path = self._cache_path(chat_prompt)
+        if cache_path is not None and cache_path.exists():
+            logger.info("Returning cached analysis for identical prompt")
+            return cache_path.read_text(encoding='utf-8')
+
         try:
             # Call the OpenAI API
-            response = self.client.chat.completions.create(
-                model=self.deployment,
-                messages=chat_prompt,
-                temperature=0.2,
-                max_tokens=4000
-            )
-            
+            response = self._create_with_retry(chat_prompt)
+
             solution = response.choices[0].message.content
             logger.info("Analysis completed successfully")
+
+            # Only successful analyses are cached; error responses would
+            # otherwise mask a transient failure on the next run
+            if cache_path is not None:
+                self._write_cache(cache_path, solution)
+
             return solution
-            
+
         except Exception as e:
-            logger.error(f"Error during analysis: {str(e)}")
+            logger.error(f"{type(e).__name__} during analysis: {str(e)}")
             return f"An error occurred during analysis: {str(e)}"
-    
-    def analyze_error_from_file(self, file_path, context_lines=2, preprocess_large_files=True):
+
+    def _create_with_retry(self, chat_prompt, max_attempts=5):
+        """
+        Call the chat completions API, retrying transient failures
+        (rate limits, timeouts, connection errors) with jittered
+        exponential backoff
+
+        BadRequestError is re-raised immediately: a malformed or
+        over-limit prompt will fail the same way on every attempt.
+        """
+        from openai import (
+            APIConnectionError,
+            APITimeoutError,
+            BadRequestError,
+            RateLimitError,
+        )
+
+        for attempt in range(max_attempts):
+            try:
+                return self.client.chat.completions.create(
+                    model=self.deployment,
+                    messages=chat_prompt,
+                    temperature=0.2,
+                    max_tokens=4000
+                )
+            except BadRequestError:
+                raise
+            except (RateLimitError, APITimeoutError, APIConnectionError) as e:
+                if attempt == max_attempts - 1:
+                    raise
+                delay = min(2 ** attempt + random.random(), 30)
+                logger.warning(
+                    f"{type(e).__name__} from API "
+                    f"(attempt {attempt + 1}/{max_attempts}); retrying in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+    def _cache_path(self, chat_prompt):
+        """
+        Return the cache file path for a chat prompt, or None if caching
+        is disabled
+        """
+        if not self.use_cache:
+            return None
+
+        key = hashlib.sha256(
+            json.dumps(chat_prompt, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        return self._cache_dir / f"{key}.txt"
+
+    def _write_cache(self, cache_path, solution):
+        """
+        Write a solution to the cache atomically (write to a temp file,
+        then rename over the final path)
+        """
+        try:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(f".tmp{os.getpid()}")
+            tmp_path.write_text(solution, encoding='utf-8')
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write analysis cache: {str(e)}")
+
+    def analyze_errors_batch(self, error_texts, batch_size=20, max_workers=4):
+        """
+        Analyze multiple independent error texts with as few API calls as possible
+
+        Texts are packed into batches of up to batch_size sections per request,
+        and independent batch requests are issued concurrently. Round-trips to
+        Azure OpenAI dominate end-to-end latency, so this is much faster than
+        one call per text.
+
+        Args:
+            error_texts: List of error texts to analyze
+            batch_size: Maximum number of sections packed into one API call
+            max_workers: Maximum number of concurrent API calls
+
+        Returns:
+            List of analyses, one per input text, in the same order
+        """
+        error_texts = list(error_texts)
+        if not error_texts:
+            return []
+
+        if len(error_texts) == 1:
+            return [self.analyze_error(error_texts[0])]
+
+        batches = [error_texts[i:i + batch_size]
+                   for i in range(0, len(error_texts), batch_size)]
+
+        logger.info(f"Analyzing {len(error_texts)} error texts in {len(batches)} batched API calls")
+
+        # The OpenAI client is thread-safe, so independent batches can be
+        # in flight at the same time
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+            results = list(executor.map(self._analyze_batch, batches))
+
+        return [analysis for batch_result in results for analysis in batch_result]
+
+    def _analyze_batch(self, error_texts):
+        """
+        Analyze a single batch of error texts with one API call
+
+        Returns a list of analyses of the same length as error_texts.
+        """
+        sections = "\n\n".join(
+            f"=== SECTION {i + 1} ===\n{text}"
+            for i, text in enumerate(error_texts)
+        )
+
+        chat_prompt = [
+            {
+                "role": "system",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": """
+                        You are a specialized DevOps troubleshooting assistant.
+                        You will receive several independent error logs, each
+                        marked with an "=== SECTION i ===" header. For each
+                        section, identify the root cause and provide a clear,
+                        step-by-step solution with relevant commands and
+                        preventive measures.
+
+                        Respond with ONLY a JSON array of strings, where
+                        element i is the complete analysis for SECTION i+1.
+                        """
+                    }
+                ]
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": f"Please analyze the following DevOps errors:\n\n{sections}"
+                    }
+                ]
+            }
+        ]
+
+        try:
+            response = self._create_with_retry(chat_prompt)
+            content = response.choices[0].message.content
+        except Exception as e:
+            logger.error(f"{type(e).__name__} during batch analysis: {str(e)}")
+            return [f"An error occurred during analysis: {str(e)}"] * len(error_texts)
+
+        analyses = self._parse_batch_response(content)
+        if len(analyses) != len(error_texts):
+            logger.warning(
+                f"Batch response had {len(analyses)} analyses for "
+                f"{len(error_texts)} sections; returning raw response"
+            )
+            return [content] * len(error_texts)
+
+        return analyses
+
+    @staticmethod
+    def _parse_batch_response(content):
+        """
+        Parse the JSON array of analyses from a batch response,
+        tolerating a Markdown code fence around the JSON
+        """
+        cleaned = re.sub(r'^```(?:json)?\s*|\s*```$', '', content.strip())
+        try:
+            analyses = json.loads(cleaned)
+        except json.JSONDecodeError:
+            return []
+
+        if isinstance(analyses, list):
+            return [str(analysis) for analysis in analyses]
+        return []
+
+    def analyze_error_from_file(self, file_path, context_lines=2, preprocess_large_files=True,
+                                token_budget=DEFAULT_TOKEN_BUDGET):
         """
         Read error text from a file and analyze it
-        
+
         Args:
             file_path: Path to the file containing error text
             context_lines: Number of lines before and after error lines to include when preprocessing
             preprocess_large_files: Whether to preprocess large log files to extract only error sections
+            token_budget: Maximum number of prompt tokens to send to the API
         """
         try:
             file_size = os.path.getsize(file_path)
@@ -128,9 +351,10 @@ class DevOpsErrorAnalyzer:
                 # Create preprocessor instance
                 preprocessor = LogPreprocessor(context_lines=context_lines)
                 
-                # Extract error sections
+                # Extract error sections and trim to the token budget
                 start_time = time.time()
                 error_text = preprocessor.extract_error_sections(file_path)
+                error_text = preprocessor.truncate_to_token_budget(error_text, token_budget)
                 end_time = time.time()
                 
                 # Get error pattern statistics
@@ -141,21 +365,7 @@ class DevOpsErrorAnalyzer:
                 logger.info(f"Error statistics: {error_stats}")
                 
                 # Add a summary of error statistics to the error text
-                stats_summary = "\n\n" + "="*80 + "\nERROR STATISTICS SUMMARY\n" + "="*80 + "\n"
-                stats_summary += f"Total errors identified: {error_stats['error_count']}\n"
-                stats_summary += f"Total warnings identified: {error_stats['warning_count']}\n"
-                
-                if error_stats['exception_types']:
-                    stats_summary += "\nException types:\n"
-                    for exception, count in error_stats['exception_types'].items():
-                        stats_summary += f"- {exception}: {count} occurrences\n"
-                
-                if error_stats['error_codes']:
-                    stats_summary += "\nError codes:\n"
-                    for code, count in error_stats['error_codes'].items():
-                        stats_summary += f"- {code}: {count} occurrences\n"
-                
-                error_text = stats_summary + "\n" + error_text
+                error_text = _format_stats(error_stats) + "\n" + error_text
                 
                 if file_size_mb > 3:  # For very large files, add a note for the AI
                     error_text = (
@@ -166,9 +376,10 @@ class DevOpsErrorAnalyzer:
                 
                 return self.analyze_error(error_text)
             else:
-                # For smaller files, read the entire content
-                with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
-                    error_text = file.read()
+                # For smaller files, read the entire content as bytes and
+                # decode once
+                with open(file_path, 'rb') as file:
+                    error_text = file.read().decode('utf-8', 'replace')
                 return self.analyze_error(error_text)
         except Exception as e:
             logger.error(f"Error reading file {file_path}: {str(e)}")
@@ -179,7 +390,7 @@ def main():
     
     # Add arguments
     parser.add_argument('--text', type=str, help='Error text to analyze')
-    parser.add_argument('--file', type=str, help='Path to file containing error text')
+    parser.add_argument('--file', type=str, nargs='+', help='Path to one or more files containing error text')
     parser.add_argument('--api-key', type=str, help='Azure OpenAI API key')
     parser.add_argument('--endpoint', type=str, help='Azure OpenAI endpoint URL')
     parser.add_argument('--deployment', type=str, help='Azure OpenAI deployment name')
@@ -187,58 +398,95 @@ def main():
     parser.add_argument('--context-lines', type=int, default=2, help='Number of context lines to include before and after error lines (default: 2)')
     parser.add_argument('--raw', action='store_true', help='Process raw log file without preprocessing')
     parser.add_argument('--save-preprocessed', type=str, help='Save the preprocessed log to a file before analysis')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the local analysis cache and always call the API')
+    parser.add_argument('--token-budget', type=int, default=DEFAULT_TOKEN_BUDGET,
+                        help=f'Maximum number of prompt tokens to send to the API (default: {DEFAULT_TOKEN_BUDGET})')
     
     args = parser.parse_args()
-    
-    # Initialize the analyzer
+
+    if not args.text and not args.file:
+        print("Please provide error text using --text or --file argument")
+        parser.print_help()
+        return 1
+
     try:
+        # Initialize the analyzer (this is what imports the OpenAI SDK,
+        # so it only happens once the arguments are known to be valid)
         analyzer = DevOpsErrorAnalyzer(
             endpoint=args.endpoint,
             deployment=args.deployment,
-            api_key=args.api_key
+            api_key=args.api_key,
+            use_cache=not args.no_cache
         )
-          # Get the error text
+
+        # Get the error text
         error_text = None
         preprocessed_text = None
-        
+
         if args.text:
             error_text = args.text
             solution = analyzer.analyze_error(error_text)
-        elif args.file:
-            logger.info(f"Processing log file: {args.file}")
-            
+        elif args.file and len(args.file) == 1:
+            log_file = args.file[0]
+            logger.info(f"Processing log file: {log_file}")
+
             # Check if preprocessing should be skipped
             should_preprocess = not args.raw
-            
+
             # If file needs to be processed, use the preprocessing function
             if should_preprocess:
-                # Process the file and get analysis
+                # Preprocess once, then reuse the result for both the saved
+                # copy and the analysis instead of re-scanning the file
+                preprocessor = LogPreprocessor(context_lines=args.context_lines)
+                preprocessed_text = preprocessor.extract_error_sections(log_file)
+                preprocessed_text = preprocessor.truncate_to_token_budget(
+                    preprocessed_text, args.token_budget)
+
                 if args.save_preprocessed:
-                    # First get the preprocessed text
-                    preprocessor = LogPreprocessor(context_lines=args.context_lines)
-                    preprocessed_text = preprocessor.extract_error_sections(args.file)
-                    
-                    # Save the preprocessed text
                     with open(args.save_preprocessed, 'w', encoding='utf-8') as file:
                         file.write(preprocessed_text)
                     logger.info(f"Saved preprocessed log to: {args.save_preprocessed}")
-                
-                # Analyze the file with preprocessing
-                solution = analyzer.analyze_error_from_file(
-                    args.file, 
-                    context_lines=args.context_lines, 
-                    preprocess_large_files=should_preprocess
-                )
+
+                # Add a summary of error statistics to the error text
+                error_stats = preprocessor.extract_error_patterns(preprocessed_text)
+                error_text = _format_stats(error_stats) + "\n" + preprocessed_text
+
+                file_size_mb = os.path.getsize(log_file) / (1024 * 1024)
+                if file_size_mb > 3:  # For very large files, add a note for the AI
+                    error_text = (
+                        "NOTE: This is a preprocessed version of a very large log file "
+                        f"({file_size_mb:.2f} MB). Only sections containing errors and "
+                        f"{args.context_lines} lines of context before and after are included.\n\n"
+                    ) + error_text
+
+                solution = analyzer.analyze_error(error_text)
             else:
-                # Read the entire file without preprocessing
-                with open(args.file, 'r', encoding='utf-8', errors='replace') as file:
-                    error_text = file.read()
+                # Read the entire file without preprocessing, decoding once
+                with open(log_file, 'rb') as file:
+                    error_text = file.read().decode('utf-8', 'replace')
                 solution = analyzer.analyze_error(error_text)
-        else:
-            print("Please provide error text using --text or --file argument")
-            parser.print_help()
-            return 1
-        
+        elif args.file:
+            # Multiple files: preprocess each one, then analyze them together
+            # in batched, concurrent API calls
+            logger.info(f"Processing {len(args.file)} log files")
+
+            if args.raw:
+                error_texts = []
+                for log_file in args.file:
+                    with open(log_file, 'rb') as file:
+                        error_texts.append(file.read().decode('utf-8', 'replace'))
+            else:
+                preprocessor = LogPreprocessor(context_lines=args.context_lines)
+                error_texts = [
+                    preprocessor.truncate_to_token_budget(text, args.token_budget)
+                    for text in preprocessor.preprocess_many(args.file)
+                ]
+
+            analyses = analyzer.analyze_errors_batch(error_texts)
+            solution = "\n\n".join(
+                "="*50 + f"\nFILE: {log_file}\n" + "="*50 + "\n\n" + analysis
+                for log_file, analysis in zip(args.file, analyses)
+            )
         # Output the solution
         if args.output:
             with open(args.output, 'w', encoding='utf-8') as file:
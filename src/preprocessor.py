@@ -2,14 +2,113 @@
 Log file preprocessor to extract relevant error information from large log files
 """
 
+import io
 import os
 import re
+import mmap
 import logging
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Dict, Set, Tuple
 
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
 logger = logging.getLogger("devops_error_analyzer.preprocessor")
 
+# Patterns used by extract_error_patterns, compiled once at import time
+# instead of on every call
+_ERR_WARN_RE = re.compile(r'(error)|(warning)', re.IGNORECASE)
+_EXC_RE = re.compile(r'([A-Za-z]+Exception|[A-Za-z]+Error):')
+_CODE_RE = re.compile(r'(?:error|code)[\s:=]+([A-Z0-9_\-]+)', re.IGNORECASE)
+_LINE_RE = re.compile(r'^.*error.*$|^.*exception.*$|^.*fail.*$',
+                      re.IGNORECASE | re.MULTILINE)
+# UUIDs, numbers, and quoted strings are all replaced in one substitution
+# pass; the matched group name selects the placeholder
+_SIMPLIFY_RE = re.compile(
+    r'(?P<uuid>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})'
+    r'|(?P<num>\b\d+\b)'
+    r'|(?P<str>\"[^\"]+\")'
+)
+_SIMPLIFY_PLACEHOLDERS = {'uuid': '<UUID>', 'num': '<NUM>', 'str': '<STRING>'}
+
+
+def _simplify_repl(match):
+    """Substitution callback mapping each matched group to its placeholder"""
+    return _SIMPLIFY_PLACEHOLDERS[match.lastgroup]
+
+# Files above this size are scanned with one worker process per CPU
+_PARALLEL_SCAN_THRESHOLD_MB = 50
+
+# Number of leading lines returned as a sample when no errors are found
+_FALLBACK_SAMPLE_LINES = 100
+
+# Separator written between extracted error sections
+_SECTION_SEPARATOR = "\n\n" + "="*40 + " ERROR SECTION " + "="*40 + "\n\n"
+
+# tiktoken encoding, loaded on first use (None = not tried, False = unavailable)
+_tiktoken_encoding = None
+
+
+def _count_tokens(text: str) -> int:
+    """
+    Count the tokens in a string with tiktoken, falling back to a
+    ~4-characters-per-token estimate when the encoding is unavailable
+    """
+    global _tiktoken_encoding
+    if _tiktoken_encoding is None:
+        if tiktoken is not None:
+            try:
+                _tiktoken_encoding = tiktoken.encoding_for_model("gpt-4o")
+            except Exception as e:
+                logger.warning(f"Could not load tiktoken encoding: {str(e)}")
+                _tiktoken_encoding = False
+        else:
+            _tiktoken_encoding = False
+
+    if _tiktoken_encoding:
+        return len(_tiktoken_encoding.encode(text))
+    return len(text) // 4
+
+
+def _minimize_keywords(keywords):
+    """
+    Lowercase and dedupe a keyword set, dropping any keyword that contains
+    another keyword as a substring: the shorter keyword already matches
+    every line the longer one would, so the extra branch only bloats the
+    regex/automaton
+    """
+    lowered = {keyword.lower() for keyword in keywords}
+    return sorted(keyword for keyword in lowered
+                  if not any(other != keyword and other in keyword
+                             for other in lowered))
+
+
+def _scan_chunk(task):
+    """
+    Worker for the parallel scan: mmap the file and return the
+    (start, end) byte offsets of every keyword match in [start, end)
+
+    Args:
+        task: Tuple of (log_file_path, start, end, pattern_bytes)
+    """
+    log_file_path, start, end, pattern = task
+    error_re = re.compile(pattern)
+
+    with open(log_file_path, 'rb') as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return [(match.start(), match.end())
+                for match in error_re.finditer(mm, start, end)]
+
 class LogPreprocessor:
     """
     Preprocesses large log files to extract error-related content
@@ -17,43 +116,122 @@ class LogPreprocessor:
     """
     
     # Keywords to look for in log files
-    ERROR_KEYWORDS = [
-        "error", "exception", "failure", "fail", "failed", "critical", 
+    ERROR_KEYWORDS = frozenset([
+        "error", "exception", "failure", "fail", "failed", "critical",
         "severe", "fatal", "crash", "crashed", "abort", "aborted",
-        "denied", "denied", "reject", "rejected", "timeout", "timed out",
-        "invalid", "incorrect", "warning", "alert", "emergency", 
-        "panic", "unexpected", "unable", "cannot", "not found", 
+        "denied", "reject", "rejected", "timeout", "timed out",
+        "invalid", "incorrect", "warning", "alert", "emergency",
+        "panic", "unexpected", "unable", "cannot", "not found",
         "forbidden", "prohibited", "unauthorized", "access denied",
         "permission denied", "insufficient", "missing", "bad request",
         "out of memory", "OOM", "killed", "segfault", "null pointer",
         "unexpected EOF", "corrupt", "deadlock", "race condition",
         "leaked", "overflow", "underflow", "exceed", "too many",
         "too few", "too large", "too small"
-    ]
-    
+    ])
+
+    # Minimized lowercase keyword list used to build the regexes and the
+    # automaton, computed once at class load
+    _KEYWORDS_MINIMIZED = _minimize_keywords(ERROR_KEYWORDS)
+
     def __init__(self, context_lines: int = 2, max_errors: int = 500):
         """
         Initialize the log preprocessor
-        
+
         Args:
             context_lines: Number of lines before and after error lines to include
             max_errors: Maximum number of error sections to extract (to prevent token overflow)
         """
         self.context_lines = context_lines
         self.max_errors = max_errors
+
+        # Compile all keywords into a single case-insensitive alternation so
+        # each line is scanned once in C instead of once per keyword in Python
+        self._error_re = re.compile(
+            "|".join(re.escape(keyword) for keyword in self._KEYWORDS_MINIMIZED),
+            re.IGNORECASE
+        )
+
+        # Bytes variant of the same alternation, used to scan mmap'd files
+        # directly without decoding every line to str first
+        self._error_re_bytes = re.compile(
+            b"(?i)" + b"|".join(re.escape(keyword.encode())
+                                for keyword in self._KEYWORDS_MINIMIZED)
+        )
+
+        # Optional Aho-Corasick automaton for keyword matching in decoded
+        # text: matches every keyword in one linear pass with no
+        # per-alternative backtracking (pyahocorasick matches str, so the
+        # mmap byte scan keeps the compiled bytes alternation). Each keyword
+        # is added in its lower/UPPER/Capitalized forms so the input never
+        # has to be lowercased into a full copy before matching.
+        self._keyword_automaton = None
+        if ahocorasick is not None:
+            automaton = ahocorasick.Automaton()
+            for keyword in self._KEYWORDS_MINIMIZED:
+                for variant in {keyword, keyword.upper(), keyword.capitalize()}:
+                    automaton.add_word(variant, keyword)
+            automaton.make_automaton()
+            self._keyword_automaton = automaton
     
     def extract_error_sections(self, log_file_path: str) -> str:
         """
         Extract error-related sections from a log file
-        
+
         Args:
             log_file_path: Path to the log file
-            
+
         Returns:
             Consolidated error sections as a single string
         """
+        buffer = io.StringIO()
+        self.write_error_sections(log_file_path, buffer)
+        return buffer.getvalue()
+
+    def preprocess_many(self, log_file_paths: List[str], max_workers: int = None) -> List[str]:
+        """
+        Extract error sections from several log files concurrently
+
+        Files are handed to a thread pool so one file's disk reads overlap
+        another's scan work instead of leaving the disk idle; results come
+        back in input order. Files large enough for the parallel scan still
+        fan out to worker processes internally.
+
+        Args:
+            log_file_paths: Paths of the log files to preprocess
+            max_workers: Thread pool size (default: one per file, capped
+                at the CPU count)
+
+        Returns:
+            List of consolidated error sections, one per input file
+        """
+        log_file_paths = list(log_file_paths)
+        if len(log_file_paths) <= 1:
+            return [self.extract_error_sections(path) for path in log_file_paths]
+
+        if max_workers is None:
+            max_workers = min(len(log_file_paths), os.cpu_count() or 1)
+
+        logger.info(f"Preprocessing {len(log_file_paths)} log files with {max_workers} workers")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.extract_error_sections, log_file_paths))
+
+    def write_error_sections(self, log_file_path: str, out_fileobj) -> None:
+        """
+        Extract error-related sections from a log file, writing them to a
+        file object as they are found
+
+        Unlike extract_error_sections, this never materializes the full
+        extract in memory, so it can write arbitrarily large outputs
+        straight to disk.
+
+        Args:
+            log_file_path: Path to the log file
+            out_fileobj: Writable text file object to receive the sections
+        """
         logger.info(f"Preprocessing log file: {log_file_path}")
-        
+
         try:
             # Check if file exists and get file size
             file_path = Path(log_file_path)
@@ -65,81 +243,205 @@ class LogPreprocessor:
             
             logger.info(f"Log file size: {file_size_mb:.2f} MB")
             
-            # Read the file and extract error sections
-            error_sections = []
-            line_count = 0
-            
-            # First pass: count lines and check if preprocessing is needed
-            with open(log_file_path, 'r', encoding='utf-8', errors='replace') as file:
-                for _ in file:
-                    line_count += 1
-            
-            logger.info(f"Log file line count: {line_count}")
-            
-            # If file is small enough, return it as is
+            # If file is small enough, pass it through as is (read as bytes
+            # and decoded once, so malformed UTF-8 never hits the per-line
+            # replacement slow path)
             if file_size_mb < 0.2:  # Less than 200KB
                 logger.info("Log file is small, returning entire content")
-                with open(log_file_path, 'r', encoding='utf-8', errors='replace') as file:
-                    return file.read()
-            
-            # For larger files, extract error sections
-            with open(log_file_path, 'r', encoding='utf-8', errors='replace') as file:
-                # Read all lines into memory
-                lines = file.readlines()
-                
-            # Find lines with error keywords
-            error_line_indices = set()
-            for i, line in enumerate(lines):
-                line_lower = line.lower()
-                if any(keyword in line_lower for keyword in self.ERROR_KEYWORDS):
-                    error_line_indices.add(i)
-            
-            logger.info(f"Found {len(error_line_indices)} lines with error keywords")
-            
-            # Extract sections with context
-            extracted_sections = []
-            processed_indices = set()
-            
-            # Sort the error line indices to process them in order
-            for i in sorted(error_line_indices):
-                # Skip if already processed as part of another section
-                if i in processed_indices:
-                    continue
-                
-                # Determine section boundaries
-                start_idx = max(0, i - self.context_lines)
-                end_idx = min(len(lines) - 1, i + self.context_lines)
-                
-                # Mark all indices in this range as processed
-                for idx in range(start_idx, end_idx + 1):
-                    processed_indices.add(idx)
-                
-                # Extract the section
-                section = "".join(lines[start_idx:end_idx + 1])
-                extracted_sections.append(section)
-                
-                # Check if we've hit the maximum number of sections
-                if len(extracted_sections) >= self.max_errors:
+                with open(log_file_path, 'rb') as file:
+                    out_fileobj.write(file.read().decode('utf-8', 'replace'))
+                return
+
+            # For larger files, mmap the file and run the compiled bytes
+            # regex over it directly: the scan happens in C over the mapped
+            # pages, and only the matched sections are ever decoded to str
+            with open(log_file_path, 'rb') as file, \
+                    mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # Find all keyword matches, fanning out to worker processes
+                # for very large files
+                if file_size_mb > _PARALLEL_SCAN_THRESHOLD_MB:
+                    match_spans = self._scan_parallel(log_file_path, mm)
+                else:
+                    match_spans = [(match.start(), match.end())
+                                   for match in self._error_re_bytes.finditer(mm)]
+                match_count = len(match_spans)
+
+                # Collect the context window around every match as a byte
+                # interval, then merge overlapping/adjacent intervals so each
+                # error cluster comes out as one contiguous section
+                intervals = [self._expand_to_section(mm, start, end)
+                             for start, end in match_spans]
+
+                merged = self._merge_overlapping_sections(intervals)
+                if len(merged) > self.max_errors:
                     logger.warning(f"Reached maximum error section limit: {self.max_errors}")
-                    break
-            
-            # Join extracted sections with separators
-            if extracted_sections:
-                consolidated_errors = "\n\n" + "="*40 + " ERROR SECTION " + "="*40 + "\n\n".join(extracted_sections)
-                logger.info(f"Extracted {len(extracted_sections)} error sections with context")
-                return consolidated_errors
-            else:
-                logger.warning("No error sections found in log file")
-                
-                # If no error sections found, return a sample of the log
-                sample_size = min(100, len(lines))
-                logger.info(f"Returning first {sample_size} lines as a sample")
-                return "".join(lines[:sample_size]) + "\n\n[...log file continues...]"
+                    merged = merged[:self.max_errors]
+
+                logger.info(f"Found {match_count} error keyword matches")
+
+                # Write out the sections with separators, decoding each one
+                # straight from its byte interval as it is emitted
+                if merged:
+                    for i, (start, end) in enumerate(merged):
+                        if i > 0:
+                            out_fileobj.write(_SECTION_SEPARATOR)
+                        out_fileobj.write(mm[start:end].decode('utf-8', 'replace'))
+                    logger.info(f"Extracted {len(merged)} error sections with context")
+                else:
+                    logger.warning("No error sections found in log file")
+
+                    # If no error sections found, write a sample of the log;
+                    # only the first _FALLBACK_SAMPLE_LINES lines are ever
+                    # decoded, regardless of file size
+                    sample_end = self._offset_after_lines(mm, 0, _FALLBACK_SAMPLE_LINES)
+                    logger.info(f"Returning the first {_FALLBACK_SAMPLE_LINES} lines as a sample")
+                    out_fileobj.write(mm[:sample_end].decode('utf-8', 'replace'))
+                    out_fileobj.write("\n\n[...log file continues...]")
                 
         except Exception as e:
             logger.error(f"Error preprocessing log file: {str(e)}")
             raise
     
+    def count_keyword_hits(self, text: str) -> int:
+        """
+        Count error keyword occurrences in a decoded string
+
+        Uses the Aho-Corasick automaton when pyahocorasick is installed,
+        falling back to the compiled alternation regex otherwise.
+
+        Args:
+            text: Decoded log text to scan
+
+        Returns:
+            Number of keyword occurrences found
+        """
+        if self._keyword_automaton is not None:
+            return sum(1 for _ in self._keyword_automaton.iter(text))
+        return sum(1 for _ in self._error_re.finditer(text))
+
+    def truncate_to_token_budget(self, error_text: str, token_budget: int) -> str:
+        """
+        Trim preprocessed text to fit a token budget before it is sent to
+        the API, keeping the highest-severity sections
+
+        Sections are ranked by their error keyword density and packed
+        greedily until the budget is reached, then emitted in their
+        original order. Catching an oversized prompt locally avoids a
+        wasted round-trip that the API would reject anyway.
+
+        Args:
+            error_text: Preprocessed text (sections joined by the standard separator)
+            token_budget: Maximum number of tokens to keep
+
+        Returns:
+            The text, trimmed if necessary, with a marker noting any
+            omitted sections
+        """
+        if _count_tokens(error_text) <= token_budget:
+            return error_text
+
+        sections = error_text.split(_SECTION_SEPARATOR)
+        ranked = sorted(range(len(sections)),
+                        key=lambda i: self.count_keyword_hits(sections[i]),
+                        reverse=True)
+
+        separator_tokens = _count_tokens(_SECTION_SEPARATOR)
+        kept = set()
+        total_tokens = 0
+        for index in ranked:
+            section_tokens = _count_tokens(sections[index]) + separator_tokens
+            if total_tokens + section_tokens > token_budget:
+                break
+            kept.add(index)
+            total_tokens += section_tokens
+
+        if not kept:
+            # Even the highest-severity section is over budget on its own;
+            # keep a hard-truncated prefix of it rather than nothing
+            top = ranked[0]
+            kept.add(top)
+            sections[top] = sections[top][:token_budget * 4]
+
+        omitted = len(sections) - len(kept)
+        logger.warning(f"Token budget {token_budget} exceeded; omitting {omitted} of {len(sections)} sections")
+
+        truncated = _SECTION_SEPARATOR.join(sections[i] for i in sorted(kept))
+        return truncated + f"\n\n[{omitted} sections omitted to fit the token budget]"
+
+    def _scan_parallel(self, log_file_path: str, mm) -> List[Tuple[int, int]]:
+        """
+        Scan the file for keyword matches using one worker process per CPU
+
+        The file is split into byte ranges snapped to newline boundaries,
+        each worker scans its range independently, and the match offsets
+        are combined in order.
+
+        Args:
+            log_file_path: Path to the log file (re-mmap'd by each worker)
+            mm: mmap of the file, used to align chunk boundaries
+
+        Returns:
+            Sorted list of (start, end) byte offsets of keyword matches
+        """
+        workers = os.cpu_count() or 1
+        size = len(mm)
+
+        # Snap each chunk boundary forward to the next newline so no line
+        # straddles two workers
+        bounds = [size * i // workers for i in range(workers + 1)]
+        for i in range(1, workers):
+            newline = mm.find(b'\n', bounds[i])
+            bounds[i] = size if newline == -1 else newline + 1
+
+        tasks = [(log_file_path, bounds[i], bounds[i + 1], self._error_re_bytes.pattern)
+                 for i in range(workers) if bounds[i] < bounds[i + 1]]
+
+        logger.info(f"Scanning in parallel across {len(tasks)} worker processes")
+
+        with multiprocessing.Pool(len(tasks)) as pool:
+            results = pool.map(_scan_chunk, tasks)
+
+        return sorted(span for chunk_spans in results for span in chunk_spans)
+
+    def _expand_to_section(self, mm, match_start: int, match_end: int) -> Tuple[int, int]:
+        """
+        Expand a keyword match to the byte range covering its full line
+        plus context_lines lines before and after
+
+        Args:
+            mm: Readable buffer (mmap) containing the log
+            match_start: Byte offset where the match starts
+            match_end: Byte offset where the match ends
+
+        Returns:
+            (start, end) byte offsets of the section, end exclusive
+        """
+        # Walk back to the start of the matched line, then context_lines more
+        start = mm.rfind(b'\n', 0, match_start) + 1
+        for _ in range(self.context_lines):
+            if start == 0:
+                break
+            prev_newline = mm.rfind(b'\n', 0, start - 1)
+            start = 0 if prev_newline == -1 else prev_newline + 1
+
+        # Walk forward past the end of the matched line plus context_lines
+        end = self._offset_after_lines(mm, match_end, self.context_lines + 1)
+
+        return start, end
+
+    @staticmethod
+    def _offset_after_lines(mm, offset: int, line_count: int) -> int:
+        """
+        Return the byte offset just past line_count newlines from offset,
+        or the end of the buffer if fewer lines remain
+        """
+        for _ in range(line_count):
+            newline = mm.find(b'\n', offset)
+            if newline == -1:
+                return len(mm)
+            offset = newline + 1
+        return offset
+
     def _merge_overlapping_sections(self, sections: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
         """
         Merge overlapping sections
@@ -188,49 +490,26 @@ class LogPreprocessor:
         }
         
         # Extract exception types
-        exception_pattern = r'([A-Za-z]+Exception|[A-Za-z]+Error):'
-        exceptions = re.findall(exception_pattern, log_text)
-        for exception in exceptions:
-            if exception in error_stats["exception_types"]:
-                error_stats["exception_types"][exception] += 1
-            else:
-                error_stats["exception_types"][exception] = 1
-        
+        error_stats["exception_types"] = dict(Counter(_EXC_RE.findall(log_text)))
+
         # Extract error codes
-        error_code_pattern = r'(?:error|code)[\s:=]+([A-Z0-9_\-]+)'
-        error_codes = re.findall(error_code_pattern, log_text, re.IGNORECASE)
-        for code in error_codes:
-            if code in error_stats["error_codes"]:
-                error_stats["error_codes"][code] += 1
-            else:
-                error_stats["error_codes"][code] = 1
+        error_stats["error_codes"] = dict(Counter(_CODE_RE.findall(log_text)))
         
-        # Count errors and warnings
-        error_stats["error_count"] = log_text.lower().count("error")
-        error_stats["warning_count"] = log_text.lower().count("warning")
-        
-        # Extract common error messages
-        error_line_pattern = r'^.*error.*$|^.*exception.*$|^.*fail.*$'
-        error_lines = re.findall(error_line_pattern, log_text, re.IGNORECASE | re.MULTILINE)
-        
-        # Simplify and count recurring error patterns
-        simplified_errors = {}
-        for line in error_lines:
-            # Replace specific details with placeholders to identify common patterns
-            simplified = re.sub(r'[0-9a-f]{8}[-0-9a-f]{4}[-0-9a-f]{4}[-0-9a-f]{4}[-0-9a-f]{12}', '<UUID>', line)
-            simplified = re.sub(r'\b\d+\b', '<NUM>', simplified)
-            simplified = re.sub(r'\"[^\"]+\"', '<STRING>', simplified)
-            
-            if simplified in simplified_errors:
-                simplified_errors[simplified] += 1
+        # Count errors and warnings in one pass, without copying the text
+        for match in _ERR_WARN_RE.finditer(log_text):
+            if match.lastindex == 1:
+                error_stats["error_count"] += 1
             else:
-                simplified_errors[simplified] = 1
-        
-        # Sort by frequency and take top 10
-        error_stats["common_errors"] = dict(sorted(
-            simplified_errors.items(), 
-            key=lambda x: x[1], 
-            reverse=True
-        )[:10])
+                error_stats["warning_count"] += 1
         
+        # Extract common error messages
+        error_lines = _LINE_RE.findall(log_text)
+
+        # Simplify recurring error patterns by replacing specific details
+        # with placeholders, then keep the 10 most frequent
+        simplified_errors = Counter(
+            _SIMPLIFY_RE.sub(_simplify_repl, line) for line in error_lines
+        )
+        error_stats["common_errors"] = dict(simplified_errors.most_common(10))
+
         return error_stats
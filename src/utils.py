@@ -55,7 +55,14 @@ class ErrorClassifier:
             r"no route to host",
         ]
     }
-    
+
+    # Union each category's patterns into one compiled regex at class load,
+    # so classification is one search per category instead of one per pattern
+    _COMPILED_PATTERNS = {
+        category: re.compile("|".join(patterns), re.IGNORECASE)
+        for category, patterns in ERROR_PATTERNS.items()
+    }
+
     @classmethod
     def classify_error(cls, error_text):
         """
@@ -63,35 +70,26 @@ class ErrorClassifier:
         """
         if not error_text:
             return []
-        
-        categories = []
-        for category, patterns in cls.ERROR_PATTERNS.items():
-            for pattern in patterns:
-                if re.search(pattern, error_text, re.IGNORECASE):
-                    categories.append(category)
-                    break
-        
-        return list(set(categories))  # Remove duplicates
+
+        return [category for category, pattern in cls._COMPILED_PATTERNS.items()
+                if pattern.search(error_text)]
+
+# Common error code patterns, combined into a single alternation so one
+# pass over the text finds all of them
+_ERROR_CODE_RE = re.compile(
+    r'error\s+code[:\s]+([A-Z0-9\-_]+)'
+    r'|exit\s+code[:\s]+(\d+)'
+    r'|status\s+code[:\s]+(\d+)'
+    r'|exception\s+code[:\s]+([A-Z0-9\-_]+)',
+    re.IGNORECASE
+)
 
 def extract_error_codes(text):
     """
     Extract error codes from text (e.g., "Error code: ABC-123")
     """
-    # Common error code patterns
-    patterns = [
-        r'error\s+code[:\s]+([A-Z0-9\-_]+)',
-        r'exit\s+code[:\s]+(\d+)',
-        r'status\s+code[:\s]+(\d+)',
-        r'exception\s+code[:\s]+([A-Z0-9\-_]+)'
-    ]
-    
-    error_codes = []
-    for pattern in patterns:
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            error_codes.append(match.group(1))
-    
-    return error_codes
+    return [match.group(match.lastindex)
+            for match in _ERROR_CODE_RE.finditer(text)]
 
 def generate_error_summary(error_text):
     """